@@ -1,83 +1,110 @@
 import asyncio
 import logging
 import os
-import shutil
+import zipfile
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
-from pathlib import Path
 
 import pandas as pd
+import pyarrow as pa
 from joblib import Parallel, delayed
+from pyarrow import csv as pacsv
 
 from config import Config
 from fetcher.binance import BinanceFetcher
-from util import convert_interval_to_timedelta, create_aiohttp_session, batched, DEFAULT_TZ
+from util import DEFAULT_TZ, convert_interval_to_timedelta, create_aiohttp_session, is_leverage_token, recreate_dir
 
-from .aws_util import (aws_batch_list_dir, aws_download_symbol_files, aws_get_candle_dir, aws_list_dir)
-from .checksum import verify_checksum
+from .aws_util import (AWS_LIMIT_PER_HOST, AWS_TIMEOUT_SEC, aws_batch_list_dir, aws_download_symbol_files,
+                       aws_get_candle_dir, aws_list_dir)
+from .checksum import apply_verify_results, get_unverified_paths, verify_checksum
 
-from .util import read_candle_splits
+from .util import PARQUET_WRITE_KWARGS, read_candle_splits
 
-async def get_aws_candle(type_, time_interval, symbols):
-    symbol_to_dpath = {sym: aws_get_candle_dir(type_, sym, time_interval) for sym in symbols}
-    prefix_dir = os.path.join(Config.BINANCE_DATA_DIR, 'aws_data')
-    symbol_to_lddir = {
-        sym: os.path.join(prefix_dir, aws_get_candle_dir(type_, sym, time_interval, local=True)) for sym in symbols
-    }
-    dpath_to_aws_paths = await aws_batch_list_dir(symbol_to_dpath.values())
-    aws_download_symbol_files(symbol_to_dpath, symbol_to_lddir, dpath_to_aws_paths)
-
-
-async def get_aws_all_coin_perpetual(time_interval):
-    d = aws_get_candle_dir('coin_futures', '', '')[:-2]
-    paths = await aws_list_dir(d)
-    symbols = [Path(os.path.normpath(p)).parts[-1] for p in paths]
-    symbols_perp = [s for s in symbols if s.endswith('_PERP')]
-    await get_aws_candle('coin_futures', time_interval, symbols_perp)
-
-
-async def get_aws_all_usdt_perpetual(time_interval):
-    d = aws_get_candle_dir('usdt_futures', '', '')[:-2]
-    paths = await aws_list_dir(d)
-    symbols = [Path(os.path.normpath(p)).parts[-1] for p in paths]
-    symbols_perp = [s for s in symbols if s.endswith('USDT')]
-    await get_aws_candle('usdt_futures', time_interval, symbols_perp)
+async def get_aws_candle(type_, time_interval, symbols, session=None):
+    await get_aws_candle_intervals(type_, [time_interval], symbols, session)
 
 
-async def get_aws_all_usdt_spot(time_interval):
-    d = aws_get_candle_dir('spot', '', '')[:-2]
-    paths = await aws_list_dir(d)
-    symbols = [Path(os.path.normpath(p)).parts[-1] for p in paths]
-    symbols = [s for s in symbols if s.endswith('USDT')]
-
-    lev_symbols = [x for x in symbols if x.endswith(('UPUSDT', 'DOWNUSDT', 'BEARUSDT', 'BULLUSDT')) and x != 'JUPUSDT']
-    logging.info('Skip leverage tokens %s', lev_symbols)
-
-    stables = ('BKRWUSDT', 'USDCUSDT', 'USDPUSDT', 'TUSDUSDT', 'BUSDUSDT', 'FDUSDUSDT', 'DAIUSDT', 'EURUSDT', 'GBPUSDT',
-               'USBPUSDT', 'SUSDUSDT', 'PAXGUSDT', 'AEURUSDT')
-    logging.info('Skip stable coins %s', stables)
-    symbols = sorted(set(symbols) - set(lev_symbols) - set(stables))
-    logging.info('Download %s', symbols)
-    await get_aws_candle('spot', time_interval, symbols)
+async def get_aws_candle_intervals(type_, time_intervals, symbols, session=None):
+    # List directories of all (symbol, interval) pairs in one concurrent batch, then download
+    keys = [(sym, time_interval) for time_interval in time_intervals for sym in symbols]
+    key_to_dpath = {k: aws_get_candle_dir(type_, *k) for k in keys}
+    key_to_lddir = {
+        k: os.path.join(Config.BINANCE_AWS_DATA_DIR, aws_get_candle_dir(type_, *k, local=True))
+        for k in keys
+    }
+    dpath_to_aws_paths = await aws_batch_list_dir(key_to_dpath.values(), session)
+    await aws_download_symbol_files(key_to_dpath, key_to_lddir, dpath_to_aws_paths, session)
+
+
+async def _list_aws_candle_symbols(type_, session):
+    d = aws_get_candle_dir(type_, '', '')[:-2]
+    paths = await aws_list_dir(d, session)
+    return [p.rstrip('/').rsplit('/', 1)[-1] for p in paths]
+
+
+async def get_aws_all_coin_perpetual(*time_intervals):
+    async with create_aiohttp_session(AWS_TIMEOUT_SEC, limit_per_host=AWS_LIMIT_PER_HOST) as session:
+        symbols = await _list_aws_candle_symbols('coin_futures', session)
+        symbols_perp = [s for s in symbols if s.endswith('_PERP')]
+        await get_aws_candle_intervals('coin_futures', time_intervals, symbols_perp, session)
+
+
+async def get_aws_all_usdt_perpetual(*time_intervals):
+    async with create_aiohttp_session(AWS_TIMEOUT_SEC, limit_per_host=AWS_LIMIT_PER_HOST) as session:
+        symbols = await _list_aws_candle_symbols('usdt_futures', session)
+        symbols_perp = [s for s in symbols if s.endswith('USDT')]
+        await get_aws_candle_intervals('usdt_futures', time_intervals, symbols_perp, session)
+
+
+async def get_aws_all_usdt_spot(*time_intervals):
+    async with create_aiohttp_session(AWS_TIMEOUT_SEC, limit_per_host=AWS_LIMIT_PER_HOST) as session:
+        symbols = await _list_aws_candle_symbols('spot', session)
+
+        lev_symbols = [x for x in symbols if is_leverage_token(x)]
+        logging.info('Skip leverage tokens %s', lev_symbols)
+
+        # Spot downloads keep their own stable coin list, USDSUSDT and USDSBUSDT are still downloaded
+        stables = ('BKRWUSDT', 'USDCUSDT', 'USDPUSDT', 'TUSDUSDT', 'BUSDUSDT', 'FDUSDUSDT', 'DAIUSDT', 'EURUSDT',
+                   'GBPUSDT', 'USBPUSDT', 'SUSDUSDT', 'PAXGUSDT', 'AEURUSDT')
+        logging.info('Skip stable coins %s', stables)
+        symbols = sorted({x for x in symbols if x.endswith('USDT') and x not in stables and not is_leverage_token(x)})
+        logging.info('Download %s', symbols)
+        await get_aws_candle_intervals('spot', time_intervals, symbols, session)
+
+
+# Column names and types of AWS candlestick csv, declared once so pyarrow does not guess
+AWS_CANDLE_CSV_COLUMNS = [
+    'candle_begin_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'trade_num',
+    'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
+]
+AWS_CANDLE_CSV_TYPES = {
+    'candle_begin_time': pa.int64(),
+    'close_time': pa.int64(),
+    **{
+        c: pa.float64()
+        for c in ('open', 'high', 'low', 'close', 'volume', 'quote_volume', 'trade_num', 'taker_buy_base_asset_volume',
+                  'taker_buy_quote_asset_volume')
+    }
+}
 
 
 def _read_aws_futures_candle_csv(p):
-    columns = [
-        'candle_begin_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'trade_num',
-        'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
-    ]
-    df = pd.read_csv(p, names=columns)
-    if df['candle_begin_time'].at[0] == 'open_time':
-        df.drop(index=0, inplace=True)
-    df['candle_begin_time'] = pd.to_datetime(df['candle_begin_time'].astype(int), unit='ms', utc=True)
-    df['close_time'] = pd.to_datetime(df['close_time'].astype(int), unit='ms', utc=True)
-    df.drop(columns='ignore', inplace=True)
-    columns = [
-        'open', 'high', 'low', 'close', 'volume', 'quote_volume', 'trade_num', 'taker_buy_base_asset_volume',
-        'taker_buy_quote_asset_volume'
-    ]
-    for c in columns:
-        df[c] = df[c].astype(float)
+    with zipfile.ZipFile(p) as zf:
+        data = zf.read(zf.namelist()[0])
+
+    # Newer files come with a header line
+    skip_rows = 1 if data.startswith(b'open_time') else 0
+    table = pacsv.read_csv(
+        pa.BufferReader(data),
+        read_options=pacsv.ReadOptions(column_names=AWS_CANDLE_CSV_COLUMNS, skip_rows=skip_rows),
+        convert_options=pacsv.ConvertOptions(column_types=AWS_CANDLE_CSV_TYPES,
+                                             include_columns=AWS_CANDLE_CSV_COLUMNS[:-1]))
+    # Release Arrow buffers column by column while converting, peak memory stays near one copy
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+    df['candle_begin_time'] = pd.to_datetime(df['candle_begin_time'], unit='ms', utc=True)
+    df['close_time'] = pd.to_datetime(df['close_time'], unit='ms', utc=True)
     return df
 
 
@@ -94,33 +121,40 @@ def _verify(data_path):
     return True
 
 
+def _list_local_candle_symbols(type_, time_interval):
+    # One scandir over the klines directory, d_type filters out non-directory entries without a stat,
+    # then a single stat per symbol checks that the time_interval subdirectory exists
+    klines_dir = os.path.normpath(
+        os.path.join(Config.BINANCE_AWS_DATA_DIR, aws_get_candle_dir(type_, '', '', local=True)))
+    try:
+        with os.scandir(klines_dir) as it:
+            symbols = [e.name for e in it if e.is_dir(follow_symlinks=False) and not e.name.startswith('.')]
+    except FileNotFoundError:
+        return []
+    return sorted(s for s in symbols if os.path.isdir(os.path.join(klines_dir, s, time_interval)))
+
+
 def verify_aws_candle(type_, time_interval):
-    local_dirs = glob(
-        os.path.join(
-            Config.BINANCE_DATA_DIR,
-            'aws_data',
-            aws_get_candle_dir(type_, '*', time_interval, local=True),
-        ))
-    symbols = [Path(os.path.normpath(d)).parts[-2] for d in local_dirs]
-    for symbol in symbols:
-        verify_candle(type_, symbol, time_interval)
+    symbols = _list_local_candle_symbols(type_, time_interval)
+    logging.info('Verify %d symbols, will not verify number of candles', len(symbols))
+    local_dirs = [
+        os.path.join(Config.BINANCE_AWS_DATA_DIR, aws_get_candle_dir(type_, symbol, time_interval, local=True))
+        for symbol in symbols
+    ]
+
+    # Scan symbol directories in threads, then verify all files in a single joblib run rather than one per symbol
+    with ThreadPoolExecutor(max_workers=min(32, len(local_dirs) or 1)) as exe:
+        unverified_paths = [p for paths in exe.map(get_unverified_paths, local_dirs) for p in paths]
+    _verify_candle_files(unverified_paths)
 
 
 def verify_candle(type_, symbol, time_interval):
-    local_dir = os.path.join(Config.BINANCE_DATA_DIR, 'aws_data',
-                             aws_get_candle_dir(type_, symbol, time_interval, local=True))
+    local_dir = os.path.join(Config.BINANCE_AWS_DATA_DIR, aws_get_candle_dir(type_, symbol, time_interval, local=True))
     logging.info('Local directory %s', local_dir)
+    _verify_candle_files(get_unverified_paths(local_dir))
 
-    paths = sorted(glob(os.path.join(local_dir, '*.zip')))
-    unverified_paths = []
-
-    for p in paths:
-        verify_file = p + '.verified'
-        if not os.path.exists(verify_file):
-            unverified_paths.append(p)
-
-    logging.info('Will not verify number of candles')
 
+def _verify_candle_files(unverified_paths):
     logging.info('%d files to be verified', len(unverified_paths))
     if not unverified_paths:
         return
@@ -128,24 +162,14 @@ def verify_candle(type_, symbol, time_interval):
     tasks = [delayed(_verify)(p) for p in unverified_paths]
 
     results = Parallel(n_jobs=Config.N_JOBS)(tasks)
-    for unverified_path, verify_success in zip(unverified_paths, results):
-        if verify_success:
-            with open(unverified_path + '.verified', 'w') as fout:
-                fout.write('')
-        else:
-            logging.warning('%s failed to verify, deleting', unverified_path)
-            if os.path.exists(unverified_path):
-                os.remove(unverified_path)
-            checksum_path = unverified_path + '.CHECKSUM'
-            if os.path.exists(checksum_path):
-                os.remove(checksum_path)
+    num_verified, num_failed = apply_verify_results(unverified_paths, results)
+    logging.info('%d files verified, %d failed', num_verified, num_failed)
 
 
 def convert_aws_candle_csv(type_, time_interval):
     paths = glob(
         os.path.join(
-            Config.BINANCE_DATA_DIR,
-            'aws_data',
+            Config.BINANCE_AWS_DATA_DIR,
             aws_get_candle_dir(type_, '*', time_interval, local=True),
             '*.zip',
         ))
@@ -159,36 +183,38 @@ def convert_aws_candle_csv(type_, time_interval):
     logging.info('Symbols %s', list(sym_paths.keys()))
 
     odir = os.path.join(Config.BINANCE_DATA_DIR, 'candle_parquet', type_, time_interval)
-    if os.path.exists(odir):
-        logging.warning('%s exists, deleting', odir)
-        shutil.rmtree(odir)
-    os.makedirs(odir)
+    if recreate_dir(odir):
+        logging.warning('%s existed, deleted and recreated', odir)
 
     delta = convert_interval_to_timedelta(time_interval)
+    api_dir = os.path.join(Config.BINANCE_DATA_DIR, 'api_data', type_, time_interval)
+
+    Parallel(n_jobs=Config.N_JOBS, verbose=1)(
+        delayed(_convert_symbol_candle)(os.path.join(api_dir, s), ps, os.path.join(odir, f'{s}.pqt'), delta)
+        for s, ps in sym_paths.items())
+
+
+def _convert_symbol_candle(symbol_api_dir, aws_paths, output_path, delta):
+    # Module level rather than a closure, so every joblib task pickles as a plain function reference
+    symbol_api_paths = glob(os.path.join(symbol_api_dir, '*.pqt'))
+
+    # Concat api and aws candles at once, so the full symbol frame is only copied once
+    dfs = [pd.read_parquet(p) for p in symbol_api_paths]
+    dfs.extend(_read_aws_futures_candle_csv(p) for p in aws_paths)
+    df = pd.concat(dfs)
+    del dfs
 
-    def convert_symbol(symbol, paths):
-        dfs = [_read_aws_futures_candle_csv(p) for p in paths]
-        df = pd.concat(dfs)
-        symbol_api_dir = os.path.join(Config.BINANCE_DATA_DIR, 'api_data', type_, time_interval, symbol)
-        if os.path.exists(symbol_api_dir):
-            symbol_api_paths = glob(os.path.join(symbol_api_dir, '*.pqt'))
-            dfs = [pd.read_parquet(p) for p in symbol_api_paths]
-            dfs.append(df)
-            df = pd.concat(dfs)
-        df.sort_values('candle_begin_time', inplace=True, ignore_index=True)
-        df.drop_duplicates('candle_begin_time', keep='last', inplace=True, ignore_index=True)
-        df['candle_end_time'] = df['candle_begin_time'] + delta
-        df.set_index('candle_end_time', inplace=True)
-        output_path = os.path.join(odir, f'{symbol}.pqt')
-        df.to_parquet(output_path, compression='zstd')
-
-    Parallel(n_jobs=Config.N_JOBS, verbose=1)(delayed(convert_symbol)(s, ps) for s, ps in sym_paths.items())
+    df.sort_values('candle_begin_time', inplace=True, ignore_index=True)
+    df.drop_duplicates('candle_begin_time', keep='last', inplace=True, ignore_index=True)
+    df['candle_end_time'] = df['candle_begin_time'] + delta
+    df.set_index('candle_end_time', inplace=True)
+    df.to_parquet(output_path, **PARQUET_WRITE_KWARGS)
 
 
 def _get_aws_candle_missing_dts(dir_path, splits, symbol_api_dir):
-    paths = sorted(glob(os.path.join(dir_path, '*.zip')))
-    dts = [os.path.splitext(os.path.basename(p))[0] for p in paths]
-    dts = {dt.split('-', 2)[-1].replace('-', '') for dt in dts}
+    with os.scandir(dir_path) as it:
+        names = [e.name for e in it if e.name.endswith('.zip') and not e.name.startswith('.')]
+    dts = {os.path.splitext(n)[0].split('-', 2)[-1].replace('-', '') for n in names}
     dt_start, dt_end = min(dts), max(dts)
 
     segs = []
@@ -209,63 +235,76 @@ def _get_aws_candle_missing_dts(dir_path, splits, symbol_api_dir):
         dt_range = {x.strftime('%Y%m%d') for x in pd.date_range(dt_start, dt_end)}
         missings = missings.union(dt_range - dts)
 
-    if os.path.exists(symbol_api_dir):
+    try:
         downloaded_dts = {p.replace('.pqt', '') for p in os.listdir(symbol_api_dir)}
         missings = missings - downloaded_dts
+    except FileNotFoundError:
+        pass
 
     return sorted(missings)
 
 
+# Number of daily candle requests in flight per batch, weight usage is checked before every batch
+API_FETCH_BATCH_SIZE = 20
+
+
+async def _download_missing_batch(fetcher: BinanceFetcher, time_interval, api_dir, task_batch):
+    timestamp, weight = await fetcher.market_api.aioreq_time_and_weight()
+    server_ts = pd.to_datetime(timestamp, unit='ms', utc=True).tz_convert(DEFAULT_TZ)
+    logging.info('Server time %s, weight used %d, from %s to %s', server_ts, weight, task_batch[0], task_batch[-1])
+    max_minute_weight, _ = fetcher.get_api_limits()
+    if weight > max_minute_weight * 0.9:
+        await asyncio.sleep(60)
+    download_tasks = []
+    for symbol, dt in task_batch:
+        start_ts = pd.to_datetime(dt)
+        end_ts = start_ts + pd.Timedelta(hours=23, minutes=59, seconds=59)
+
+        download_tasks.append(
+            fetcher.get_candle(symbol,
+                               time_interval,
+                               startTime=start_ts.value // 1000000,
+                               endTime=end_ts.value // 1000000))
+    results = await asyncio.gather(*download_tasks)
+    for (symbol, dt), df_market in zip(task_batch, results):
+        output_dir = os.path.join(api_dir, symbol, f'{dt}.pqt')
+        df_market.to_parquet(output_dir)
+
+
 async def download_aws_missing_from_api(type_, time_interval):
-    _aws_dir = os.path.join(
-        Config.BINANCE_DATA_DIR,
-        'aws_data',
-        aws_get_candle_dir(type_, '*', time_interval, local=True),
-    )
-    symbol_aws_dirs = glob(_aws_dir)
+    symbols = _list_local_candle_symbols(type_, time_interval)
     api_dir = os.path.join(Config.BINANCE_DATA_DIR, 'api_data', type_, time_interval)
     if not os.path.exists(api_dir):
         logging.warning('%s not exists, creating', api_dir)
         os.makedirs(api_dir)
 
-    tasks = []
-    for symbol_aws_dir in symbol_aws_dirs:
-        symbol = Path(symbol_aws_dir).parts[-2]
-        splits = None
-        binance_candle_splits = read_candle_splits()
-        if type_ in binance_candle_splits:
-            splits = binance_candle_splits[type_].get(symbol, None)
-        symbol_api_dir = os.path.join(api_dir, symbol)
-        missings = _get_aws_candle_missing_dts(symbol_aws_dir, splits, symbol_api_dir)
-        if missings:
-            logging.info('%s missing dts %s', symbol, missings)
-        for dt in missings:
-            tasks.append((symbol, dt))
+    type_splits = read_candle_splits().get(type_, dict())
 
+    def _detect(symbol):
+        symbol_aws_dir = os.path.join(Config.BINANCE_AWS_DATA_DIR,
+                                      aws_get_candle_dir(type_, symbol, time_interval, local=True))
+        splits = type_splits.get(symbol, None)
+        return symbol, _get_aws_candle_missing_dts(symbol_aws_dir, splits, os.path.join(api_dir, symbol))
+
+    loop = asyncio.get_running_loop()
     async with create_aiohttp_session(30) as session:
         fetcher = BinanceFetcher(type_, session)
-        for task_batch in batched(tasks, 10):
-            timestamp, weight = await fetcher.market_api.aioreq_time_and_weight()
-            server_ts = pd.to_datetime(timestamp, unit='ms', utc=True).tz_convert(DEFAULT_TZ)
-            logging.info('Server time %s, weight used %d, from %s to %s', server_ts, weight, task_batch[0],
-                         task_batch[-1])
-            max_minute_weight, _ = fetcher.get_api_limits()
-            if weight > max_minute_weight * 0.9:
-                await asyncio.sleep(60)
-            download_tasks = []
-            for symbol, dt in task_batch:
-                start_ts = pd.to_datetime(dt)
-                end_ts = start_ts + pd.Timedelta(hours=23, minutes=59, seconds=59)
-
-                download_tasks.append(
-                    fetcher.get_candle(symbol,
-                                       time_interval,
-                                       startTime=start_ts.value // 1000000,
-                                       endTime=end_ts.value // 1000000))
-            results = await asyncio.gather(*download_tasks)
-            for (symbol, dt), df_market in zip(task_batch, results):
-                symbol_dir = os.path.join(api_dir, symbol)
-                if not os.path.exists(symbol_dir):
-                    os.makedirs(symbol_dir)
-                output_dir = os.path.join(symbol_dir, f'{dt}.pqt')
-                df_market.to_parquet(output_dir)
+
+        # Detection runs in threads off the event loop, each symbol's missing days are fetched as soon as
+        # a full batch is collected, so local directory scans overlap with API requests
+        with ThreadPoolExecutor(max_workers=min(32, len(symbols) or 1)) as exe:
+            futures = [loop.run_in_executor(exe, _detect, symbol) for symbol in symbols]
+            tasks = []
+            for fut in asyncio.as_completed(futures):
+                symbol, missings = await fut
+                if missings:
+                    logging.info('%s missing dts %s', symbol, missings)
+                    # Create once per symbol here rather than for every downloaded day
+                    os.makedirs(os.path.join(api_dir, symbol), exist_ok=True)
+                tasks.extend((symbol, dt) for dt in missings)
+                while len(tasks) >= API_FETCH_BATCH_SIZE:
+                    await _download_missing_batch(fetcher, time_interval, api_dir, tasks[:API_FETCH_BATCH_SIZE])
+                    tasks = tasks[API_FETCH_BATCH_SIZE:]
+
+        if tasks:
+            await _download_missing_batch(fetcher, time_interval, api_dir, tasks)
@@ -1,50 +1,45 @@
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 
 from config import Config
+from util import create_aiohttp_session
 
-from .aws_util import (aws_batch_list_dir, aws_download_symbol_files, aws_filter_recent_dates, aws_get_aggtrades_dir)
-from .checksum import verify_checksum
+from .aws_util import (AWS_LIMIT_PER_HOST, AWS_TIMEOUT_SEC, aws_batch_list_dir, aws_download_symbol_files,
+                       aws_filter_recent_dates, aws_get_aggtrades_dir)
+from .checksum import apply_verify_results, get_unverified_paths, verify_checksum
 from joblib import Parallel, delayed
 
 
 async def get_aws_aggtrades(type_, recent, symbols):
     logging.info('Get AWS aggtrades for %d symbols, %d recent days', len(symbols), recent)
     symbol_to_dpath = {sym: aws_get_aggtrades_dir(type_, sym) for sym in symbols}
-    dpath_to_aws_paths = await aws_batch_list_dir(symbol_to_dpath.values())
-    dpath_to_aws_paths = {dp: aws_filter_recent_dates(ps, recent) for dp, ps in dpath_to_aws_paths.items()}
+    symbol_to_lddir = {
+        sym: os.path.join(Config.BINANCE_AWS_DATA_DIR, aws_get_aggtrades_dir(type_, sym, local=True))
+        for sym in symbols
+    }
 
-    prefix_dir = os.path.join(Config.BINANCE_DATA_DIR, 'aws_data')
-    symbol_to_lddir = {sym: os.path.join(prefix_dir, aws_get_aggtrades_dir(type_, sym, local=True)) for sym in symbols}
-    aws_download_symbol_files(symbol_to_dpath, symbol_to_lddir, dpath_to_aws_paths)
+    # Listing and the aiohttp download fallback share one session and its warm connections
+    async with create_aiohttp_session(AWS_TIMEOUT_SEC, limit_per_host=AWS_LIMIT_PER_HOST) as session:
+        dpath_to_aws_paths = await aws_batch_list_dir(symbol_to_dpath.values(), session)
+        dpath_to_aws_paths = {dp: aws_filter_recent_dates(ps, recent) for dp, ps in dpath_to_aws_paths.items()}
+        await aws_download_symbol_files(symbol_to_dpath, symbol_to_lddir, dpath_to_aws_paths, session)
 
 
 def verify_aws_aggtrades(type_):
-    prefix_dir = os.path.join(Config.BINANCE_DATA_DIR, 'aws_data')
-    local_dir = os.path.join(prefix_dir, aws_get_aggtrades_dir(type_, '*', local=True))
+    local_dir = os.path.join(Config.BINANCE_AWS_DATA_DIR, aws_get_aggtrades_dir(type_, '*', local=True))
     logging.info('Local directory %s', local_dir)
 
-    paths = sorted(glob(os.path.join(local_dir, '*.zip')))
-    unverified_paths = []
-
-    for p in paths:
-        verify_file = p + '.verified'
-        if not os.path.exists(verify_file):
-            unverified_paths.append(p)
+    # Directory scans are IO bound, run them in threads
+    symbol_dirs = sorted(glob(local_dir))
+    with ThreadPoolExecutor(max_workers=min(32, len(symbol_dirs) or 1)) as exe:
+        unverified_paths = [p for paths in exe.map(get_unverified_paths, symbol_dirs) for p in paths]
 
     logging.info('%d files to be verified', len(unverified_paths))
 
-    results = Parallel(Config.N_JOBS)(delayed(verify_checksum)(p) for p in paths)
-
-    for unverified_path, verify_success in zip(unverified_paths, results):
-        if verify_success:
-            with open(unverified_path + '.verified', 'w') as fout:
-                fout.write('')
-        else:
-            logging.warning('%s failed to verify, deleting', unverified_path)
-            if os.path.exists(unverified_path):
-                os.remove(unverified_path)
-            checksum_path = unverified_path + '.CHECKSUM'
-            if os.path.exists(checksum_path):
-                os.remove(checksum_path)
+    # hashlib releases the GIL while hashing, threads avoid pickling work to worker processes
+    results = Parallel(Config.N_JOBS, prefer='threads')(delayed(verify_checksum)(p) for p in unverified_paths)
+
+    num_verified, num_failed = apply_verify_results(unverified_paths, results)
+    logging.info('%d files verified, %d failed', num_verified, num_failed)
@@ -1,12 +1,15 @@
 import asyncio
 import logging
 import os
+import shutil
 import subprocess
+from functools import lru_cache
+from urllib.parse import quote
+from xml.etree import ElementTree
 
 import aiohttp
-import xmltodict
 
-from util import async_retry_getter, create_aiohttp_session
+from util import async_retry_getter, create_aiohttp_session, gather_with_concurrency
 
 AWS_TYPE_MAP = {
     'spot': ['data', 'spot'],
@@ -16,8 +19,20 @@ AWS_TYPE_MAP = {
 
 AWS_TIMEOUT_SEC = 30
 
+# Max number of in-flight listing requests to S3
+AWS_LIST_CONCURRENCY = 32
+
+# Connections per host for AWS sessions, enough for the listing and download concurrency above
+AWS_LIMIT_PER_HOST = 32
+
+# Downloads go through aria2c when installed, otherwise through aiohttp
+ARIA2C_PATH = shutil.which('aria2c')
+AWS_DOWNLOAD_CONCURRENCY = 16
+AWS_DOWNLOAD_CHUNK_SIZE = 1 << 20
+
 PREFIX = 'https://s3-ap-northeast-1.amazonaws.com/data.binance.vision'
-PATH_API_URL = f'{PREFIX}?delimiter=/&prefix='
+# ListObjectsV2, pages are chained by continuation tokens
+PATH_API_URL = f'{PREFIX}?list-type=2&delimiter=/&prefix='
 DOWNLOAD_URL = f'{PREFIX}/'
 
 
@@ -42,18 +57,24 @@ def _get_dir(path_tokens, local):
     return '/'.join(path_tokens) + '/'
 
 
+@lru_cache(maxsize=None)
 def aws_get_candle_dir(type_, symbol, time_interval, local=False):
     return _get_dir(AWS_TYPE_MAP[type_] + ['daily', 'klines', symbol, time_interval], local)
 
 
+@lru_cache(maxsize=None)
 def aws_get_aggtrades_dir(type_, symbol, local=False):
     return _get_dir(AWS_TYPE_MAP[type_] + ['daily', 'aggTrades', symbol], local)
 
 
+S3_XMLNS = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+
 async def _aio_get(session: aiohttp.ClientSession, url):
     async with session.get(url) as resp:
-        data = await resp.text()
-    return xmltodict.parse(data)
+        data = await resp.read()
+    # Parse the raw bytes directly, no decoding to str
+    return ElementTree.fromstring(data)
 
 
 async def _list_dir(session, path):
@@ -61,50 +82,107 @@ async def _list_dir(session, path):
     base_url = url
     results = []
     while True:
-        data = await async_retry_getter(_aio_get, session=session, url=url)
-        xml_data = data['ListBucketResult']
-        if 'CommonPrefixes' in xml_data:
-            results.extend([x['Prefix'] for x in xml_data['CommonPrefixes']])
-        elif 'Contents' in xml_data:
-            results.extend([x['Key'] for x in xml_data['Contents']])
-        if xml_data['IsTruncated'] == 'false':
+        root = await async_retry_getter(_aio_get, session=session, url=url)
+        results.extend(e.text for e in root.iterfind(f'{S3_XMLNS}CommonPrefixes/{S3_XMLNS}Prefix'))
+        results.extend(e.text for e in root.iterfind(f'{S3_XMLNS}Contents/{S3_XMLNS}Key'))
+        if root.findtext(f'{S3_XMLNS}IsTruncated') != 'true':
             break
-        url = base_url + '&marker=' + xml_data['NextMarker']
+        token = root.findtext(f'{S3_XMLNS}NextContinuationToken')
+        url = base_url + '&continuation-token=' + quote(token, safe='')
     return results
 
 
-async def aws_list_dir(path):
-    async with create_aiohttp_session(AWS_TIMEOUT_SEC) as session:
-        return await _list_dir(session, path)
+async def aws_list_dir(path, session=None):
+    # Reuse the caller's session when given, to keep its connections alive across listings
+    if session is None:
+        async with create_aiohttp_session(AWS_TIMEOUT_SEC, limit_per_host=AWS_LIMIT_PER_HOST) as session:
+            return await _list_dir(session, path)
+    return await _list_dir(session, path)
+
 
+async def aws_batch_list_dir(paths, session=None):
+    if session is None:
+        async with create_aiohttp_session(AWS_TIMEOUT_SEC, limit_per_host=AWS_LIMIT_PER_HOST) as session:
+            return await aws_batch_list_dir(paths, session)
 
-async def aws_batch_list_dir(paths):
-    async with create_aiohttp_session(AWS_TIMEOUT_SEC) as session:
-        tasks = [_list_dir(session, p) for p in paths]
-        results = await asyncio.gather(*tasks)
+    tasks = [_list_dir(session, p) for p in paths]
+    results = await gather_with_concurrency(AWS_LIST_CONCURRENCY, *tasks)
     return {p: r for p, r in zip(paths, results)}
 
 
 def aws_download_into_folder(paths, output_dir):
-    os.makedirs(output_dir, exist_ok=True)
+    # aria2c creates output_dir itself when missing
     paths = [DOWNLOAD_URL + p for p in paths]
     cmd = ['aria2c', '-c', '-d', output_dir, '-Z'] + paths
 
     subprocess.run(cmd)
 
 
-def aws_download_symbol_files(symbol_to_dpath, symbol_to_lddir, dpath_to_aws_paths):
+async def _aio_download_file(session: aiohttp.ClientSession, aws_path, output_dir):
+    output_path = os.path.join(output_dir, os.path.basename(aws_path))
+    tmp_path = output_path + '.tmp'
+    # Large aggtrades files may take longer than the session total timeout, only bound each read
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=AWS_TIMEOUT_SEC)
+    try:
+        async with session.get(DOWNLOAD_URL + aws_path, timeout=timeout) as resp:
+            resp.raise_for_status()
+            # File writes run in worker threads, so concurrent downloads do not stall the event loop
+            fout = await asyncio.to_thread(open, tmp_path, 'wb')
+            try:
+                async for chunk in resp.content.iter_chunked(AWS_DOWNLOAD_CHUNK_SIZE):
+                    await asyncio.to_thread(fout.write, chunk)
+            finally:
+                await asyncio.to_thread(fout.close)
+    except BaseException:
+        # Also on cancellation, no partial .tmp file is left behind
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    # Only complete files get the final name, so an interrupted download is fetched again next time
+    os.replace(tmp_path, output_path)
+
+
+async def aws_aio_download_files(dir_to_paths, session=None):
+    """
+    Download files with aiohttp on a shared session, used when aria2c is not installed
+    dir_to_paths: output directory -> AWS paths
+    """
+    if session is None:
+        async with create_aiohttp_session(AWS_TIMEOUT_SEC, limit_per_host=AWS_LIMIT_PER_HOST) as session:
+            return await aws_aio_download_files(dir_to_paths, session)
+
+    dir_paths = [(d, p) for d, paths in dir_to_paths.items() for p in paths]
+    tasks = [
+        async_retry_getter(_aio_download_file, session=session, aws_path=p, output_dir=d) for d, p in dir_paths
+    ]
+    # Let every download settle before reporting, so one failed file does not orphan the others
+    results = await gather_with_concurrency(AWS_DOWNLOAD_CONCURRENCY, *tasks, return_exceptions=True)
+
+    num_failed = 0
+    for (d, p), ret in zip(dir_paths, results):
+        if isinstance(ret, BaseException):
+            num_failed += 1
+            logging.error('Failed to download %s into %s, %s', p, d, ret)
+    if num_failed:
+        logging.error('%d of %d files failed to download', num_failed, len(dir_paths))
+
+
+async def aws_download_symbol_files(symbol_to_dpath, symbol_to_lddir, dpath_to_aws_paths, session=None):
+    dir_to_missing_paths = dict()
     for symbol, dir_path in symbol_to_dpath.items():
         local_dir = symbol_to_lddir[symbol]
-        logging.info('Download candle from %s', dir_path)
-        logging.info('Local directory %s', local_dir)
+        logging.info('Download from %s into %s', dir_path, local_dir)
 
-        if not os.path.exists(local_dir):
+        try:
+            local_filenames = set(os.listdir(local_dir))
+        except FileNotFoundError:
             logging.warning('Local directory not exists, creating')
             os.makedirs(local_dir)
+            local_filenames = set()
 
         aws_paths = dpath_to_aws_paths[dir_path]
-        local_filenames = set(os.listdir(local_dir))
         missing_file_paths = []
 
         for aws_path in aws_paths:
@@ -115,4 +193,12 @@ def aws_download_symbol_files(symbol_to_dpath, symbol_to_lddir, dpath_to_aws_pat
         logging.info('%d files missing, downloading', len(missing_file_paths))
 
         if missing_file_paths:
-            aws_download_into_folder(missing_file_paths, local_dir)
+            if ARIA2C_PATH is not None:
+                # aria2c blocks until done, run it in a worker thread to keep the event loop responsive
+                await asyncio.to_thread(aws_download_into_folder, missing_file_paths, local_dir)
+            else:
+                dir_to_missing_paths[local_dir] = missing_file_paths
+
+    if dir_to_missing_paths:
+        logging.warning('aria2c not found, downloading %d directories with aiohttp', len(dir_to_missing_paths))
+        await aws_aio_download_files(dir_to_missing_paths, session)
@@ -1,28 +1,85 @@
 import os
 import logging
 import hashlib
+import mmap
+
+
+CHECKSUM_CHUNK_SIZE = 1 << 20
+
+
+def _sha256_file(path):
+    with open(path, 'rb', buffering=0) as fin:
+        # Python 3.11+, reads into a preallocated buffer and hashes in C
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(fin, 'sha256').hexdigest()
+
+        # Map files larger than one chunk and hash the mapping in a single call, no userspace copies
+        if os.fstat(fin.fileno()).st_size > CHECKSUM_CHUNK_SIZE:
+            with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Pages are read once front to back, let the kernel read ahead aggressively
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                return hashlib.sha256(mm).hexdigest()
+
+        h = hashlib.sha256()
+        buf = bytearray(CHECKSUM_CHUNK_SIZE)
+        view = memoryview(buf)
+        while n := fin.readinto(buf):
+            h.update(view[:n])
+        return h.hexdigest()
 
 
 def verify_checksum(data_path):
     checksum_path = data_path + '.CHECKSUM'
-    if not os.path.exists(checksum_path):
-        logging.error('Checksum file not exists %s', data_path)
-        return False
-
     try:
         with open(checksum_path, 'r') as fin:
             text = fin.read()
         checksum_standard, _ = text.strip().split()
+    except FileNotFoundError:
+        logging.error('Checksum file not exists %s', data_path)
+        return False
     except:
-        logging.error('Error reading checksum file', checksum_path)
+        logging.error('Error reading checksum file %s', checksum_path)
         return False
 
-    with open(data_path, 'rb') as file_to_check:
-        data = file_to_check.read()
-        checksum_value = hashlib.sha256(data).hexdigest()
+    checksum_value = _sha256_file(data_path)
 
     if checksum_value != checksum_standard:
         logging.error('Checksum error %s', data_path)
         return False
 
     return True
+
+
+def get_unverified_paths(dir_path):
+    """
+    List zip files under dir_path without a .verified mark, with a single os.scandir
+    """
+    # Hidden files are skipped, same as the glob('*.zip') this replaced
+    with os.scandir(dir_path) as it:
+        filenames = {e.name for e in it if not e.name.startswith('.') and e.is_file(follow_symlinks=False)}
+
+    unverified_names = [n for n in filenames if n.endswith('.zip') and n + '.verified' not in filenames]
+    return [os.path.join(dir_path, n) for n in sorted(unverified_names)]
+
+
+def apply_verify_results(paths, results):
+    """
+    Mark verified files and delete the failed ones along with their checksums
+    Returns the numbers of verified and failed files, counted in the same pass
+    """
+    num_verified = num_failed = 0
+    for path, verify_success in zip(paths, results):
+        if verify_success:
+            num_verified += 1
+            with open(path + '.verified', 'w') as fout:
+                fout.write('')
+        else:
+            num_failed += 1
+            logging.warning('%s failed to verify, deleting', path)
+            for p in (path, path + '.CHECKSUM'):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+    return num_verified, num_failed
@@ -26,23 +26,20 @@ class Bhds:
         """
         Downloads all coin perpetual daily candlestick data from Binance's AWS data center.
         """
-        for time_interval in time_intervals:
-            asyncio.run(get_aws_all_coin_perpetual(time_interval))
+        asyncio.run(get_aws_all_coin_perpetual(*time_intervals))
 
     def get_aws_all_usdt_perpetual(self, *time_intervals):
         """
         Downloads all USDT perpetual daily candlestick data from Binance's AWS data center.
         """
-        for time_interval in time_intervals:
-            asyncio.run(get_aws_all_usdt_perpetual(time_interval))
+        asyncio.run(get_aws_all_usdt_perpetual(*time_intervals))
 
     def get_aws_all_usdt_spot(self, *time_intervals):
         """
         Downloads all spot USDT pairs daily candlestick data from Binance's AWS data center.
         Leveraged coins and stablecoins are excluded.
         """
-        for time_interval in time_intervals:
-            asyncio.run(get_aws_all_usdt_spot(time_interval))
+        asyncio.run(get_aws_all_usdt_spot(*time_intervals))
 
     def get_aws_all(self, *time_intervals):
         """
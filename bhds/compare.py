@@ -16,13 +16,16 @@ def compare_aws_quantclass_candle(type_, time_interval, symbol):
     logging.info('Path %s Quantclass', path_qtc)
 
     df_aws = pd.read_parquet(path_aws)
-    logging.info('Time %s -- %s AWS', df_aws['candle_begin_time'].min(), df_aws['candle_begin_time'].max())
+    # Fixed candle files are written sorted by candle_begin_time, the bounds are just the first and last rows
+    aws_begin, aws_end = df_aws['candle_begin_time'].iloc[0], df_aws['candle_begin_time'].iloc[-1]
+    logging.info('Time %s -- %s AWS', aws_begin, aws_end)
 
     df_qtc = pd.read_parquet(path_qtc)
-    logging.info('Time %s -- %s Quantclass', df_qtc['candle_begin_time'].min(), df_qtc['candle_begin_time'].max())
+    qtc_begin, qtc_end = df_qtc['candle_begin_time'].iloc[0], df_qtc['candle_begin_time'].iloc[-1]
+    logging.info('Time %s -- %s Quantclass', qtc_begin, qtc_end)
 
-    begin_ts = max(df_aws['candle_begin_time'].min(), df_qtc['candle_begin_time'].min())
-    end_ts = min(df_aws['candle_begin_time'].max(), df_qtc['candle_begin_time'].max())
+    begin_ts = max(aws_begin, qtc_begin)
+    end_ts = min(aws_end, qtc_end)
     logging.info('Time %s -- %s', begin_ts, end_ts)
 
     df_aws = df_aws[df_aws['candle_begin_time'].between(begin_ts, end_ts)]
@@ -31,8 +34,9 @@ def compare_aws_quantclass_candle(type_, time_interval, symbol):
     df_qtc = df_qtc[df_qtc['candle_begin_time'].between(begin_ts, end_ts)]
     logging.info('Trimmed shape %s Quantclass', df_qtc.shape)
 
-    ts_intersect = set(df_aws['candle_begin_time']).intersection(set(df_qtc['candle_begin_time']))
-    logging.info('Intersecion num candle_begin_time %s', len(ts_intersect)) 
+    # Hash lookup in pandas, no Python Timestamp sets are built
+    num_intersect = df_aws['candle_begin_time'].isin(df_qtc['candle_begin_time']).sum()
+    logging.info('Intersecion num candle_begin_time %s', num_intersect)
  
     df = df_aws.join(df_qtc.set_index('candle_begin_time'), on='candle_begin_time', rsuffix='_qtc')
 
@@ -41,15 +45,17 @@ def compare_aws_quantclass_candle(type_, time_interval, symbol):
         'taker_buy_quote_asset_volume'
     ]
 
+    # Diff all columns in one frame, the max and count reductions then run column-wise at once
+    qtc_cols = [f'{c}_qtc' for c in cols]
+    diffs = (df[cols] - df[qtc_cols].set_axis(cols, axis=1)).abs()
+    max_diffs = diffs.max()
+    diff_nums = (diffs > 1e-4).sum()
+
     error_begin_time = None
     for c in cols:
-        df['diff'] = (df[c] - df[f'{c}_qtc']).abs()
-        max_diff = df['diff'].max()
-        diff_num = (df['diff'] > 1e-4).sum()
-        logging.info('Column: %s, max diff %f, diff num %d', c, max_diff, diff_num)
-        if max_diff > 1e-4:
-            error_begin_time = df[df['diff'] == max_diff].iloc[0]['candle_begin_time']
-        df.drop(columns='diff', inplace=True)
+        logging.info('Column: %s, max diff %f, diff num %d', c, max_diffs[c], diff_nums[c])
+        if max_diffs[c] > 1e-4:
+            error_begin_time = df.at[diffs[c].idxmax(), 'candle_begin_time']
 
     if error_begin_time is not None:
         df_err = pd.concat([
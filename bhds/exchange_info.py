@@ -32,9 +32,11 @@ def _get_info(x):
 def read_extra_exginfo(type_):
     p = os.path.join(Config.BHDS_EXTRA_EXGINFO_DIR, f'{type_}.json')
     logging.info('Read extra exginfo %s', p)
-    if os.path.exists(p):
-        return json.load(open(p))
-    return dict()
+    try:
+        with open(p) as fin:
+            return json.load(fin)
+    except FileNotFoundError:
+        return dict()
 
 
 async def update_exchange_info(type_):
@@ -54,11 +56,12 @@ async def update_exchange_info(type_):
     os.makedirs(output_dir, exist_ok=True)
 
     output_path = os.path.join(output_dir, f'{type_}.json')
-    if os.path.exists(output_path):
+    try:
+        with open(output_path, 'r') as fin:
+            info: dict = json.load(fin)
         logging.info('Load existing exchange info %s', output_path)
-        info: dict = json.load(open(output_path, 'r'))
         info.update(info_new)
-    else:
+    except FileNotFoundError:
         info = info_new
     
     logging.info('Output exchange info to %s', output_path)
@@ -4,6 +4,6 @@ from util.common import filter_symbols
 
 
 def get_filtered_symbols(input_dir):
-    symbols = sorted(os.path.splitext(x)[0] for x in os.listdir(input_dir))
-    symbols = filter_symbols(symbols)
+    # filter_symbols returns a sorted list, no need to sort the listing first
+    symbols = filter_symbols(os.path.splitext(x)[0] for x in os.listdir(input_dir))
     return symbols
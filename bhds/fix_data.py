@@ -1,31 +1,26 @@
 import json
 import logging
 import os
-import shutil
 
 import pandas as pd
 from joblib import Parallel, delayed
 
 from config import Config
-from util import convert_interval_to_timedelta
+from util import convert_interval_to_timedelta, recreate_dir
 
 from .filter_symbol import get_filtered_symbols
-from .util import read_candle_splits
+from .util import PARQUET_WRITE_KWARGS, read_candle_splits
 
 
 def check(df, symbol, hours_threshold):
-    df['time_diff'] = df['candle_begin_time'].diff()
+    time_diff = df['candle_begin_time'].diff()
+    is_gap = time_diff > time_diff.min()
 
-    splits = []
-    idxes = df[df['time_diff'] > df['time_diff'].min()].index
-
-    for idx in idxes:
-        tail = df.loc[:idx].tail(2)
-        end_time_before = tail.index[0]
-        begin_time_after = tail.iloc[1]['candle_begin_time']
-        time_gap = begin_time_after - end_time_before
-        if time_gap > pd.Timedelta(hours=hours_threshold):
-            splits.append((end_time_before, begin_time_after))
+    # End time of the previous candle and begin time of the candle after each gap, computed for all gaps at once
+    end_times_before = df.index.to_series().shift()[is_gap]
+    begin_times_after = df.loc[is_gap, 'candle_begin_time']
+    is_split = (begin_times_after - end_times_before) > pd.Timedelta(hours=hours_threshold)
+    splits = list(zip(end_times_before[is_split], begin_times_after[is_split]))
 
     if not splits:
         return None
@@ -43,13 +38,15 @@ def check_gaps(source, type_, time_interval, hours_threshold):
     input_dir = _get_input_dir(source, type_, time_interval)
     logging.info('Check candle data %s, hours_threshold=%d', input_dir, hours_threshold)
     symbols = get_filtered_symbols(input_dir)
-    results = dict()
-    for symbol in symbols:
+
+    def _check(symbol):
         candle_path = os.path.join(input_dir, f'{symbol}.pqt')
-        df = pd.read_parquet(candle_path)
-        ret = check(df, symbol, hours_threshold)
-        if ret is not None:
-            results[symbol] = ret
+        # Gap check only needs begin times, the candle_end_time index is restored from pandas metadata
+        df = pd.read_parquet(candle_path, columns=['candle_begin_time'])
+        return check(df, symbol, hours_threshold)
+
+    rets = Parallel(Config.N_JOBS)(delayed(_check)(symbol) for symbol in symbols)
+    results = {symbol: ret for symbol, ret in zip(symbols, rets) if ret is not None}
     print(json.dumps(results))
 
 
@@ -119,21 +116,20 @@ def fix_candle(source, type_, time_interval):
     logging.info('Symbols %s', symbols)
 
     delta = convert_interval_to_timedelta(time_interval)
+    type_splits = read_candle_splits().get(type_, dict())
 
     def _split_and_fill(symbol):
         candle_path = os.path.join(input_dir, f'{symbol}.pqt')
-        df = pd.read_parquet(candle_path)
-        df = df[df['volume'] > 0]
-
-        binance_candle_splits = read_candle_splits()
+        # Zero volume rows are dropped by pyarrow while reading, they are never converted to pandas
+        df = pd.read_parquet(candle_path, filters=[('volume', '>', 0)])
 
-        if type_ not in binance_candle_splits or symbol not in binance_candle_splits[type_]:
+        if symbol not in type_splits:
             output_path = os.path.join(output_dir, f'{symbol}.pqt')
             df_fixed = _fill_gap(df, delta, symbol)
-            df_fixed.to_parquet(output_path, compression='zstd')
+            df_fixed.to_parquet(output_path, **PARQUET_WRITE_KWARGS)
             return
 
-        splits = binance_candle_splits[type_][symbol]
+        splits = type_splits[symbol]
         for begin_time, end_time, symbol_new in splits:
             output_path = os.path.join(output_dir, f'{symbol_new}.pqt')
             logging.warning('Split %s %s - %s to %s', symbol, begin_time, end_time, output_path)
@@ -141,15 +137,13 @@ def fix_candle(source, type_, time_interval):
             if len(df_split) == 0:
                 continue
             df_split = _fill_gap(df_split, delta, symbol_new)
-            df_split.to_parquet(output_path, compression='zstd')
+            df_split.to_parquet(output_path, **PARQUET_WRITE_KWARGS)
 
     Parallel(Config.N_JOBS)(delayed(_split_and_fill)(symbol) for symbol in symbols)
 
 
 def _create_fixed_output_dir(input_dir):
     output_dir = input_dir.replace('candle_parquet', 'candle_parquet_fixed')
-    if os.path.exists(output_dir):
-        logging.warning('%s exists, deleting', output_dir)
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir)
+    if recreate_dir(output_dir):
+        logging.warning('%s existed, deleted and recreated', output_dir)
     return output_dir
@@ -1,15 +1,15 @@
 import logging
 import os
-import shutil
 from collections import defaultdict
 from datetime import timedelta
-from glob import glob
 
 import pandas as pd
 from joblib import Parallel, delayed
 
 from config import Config
-from util import convert_interval_to_timedelta
+from util import convert_interval_to_timedelta, recreate_dir
+
+from .util import PARQUET_WRITE_KWARGS
 
 
 def _read_quantclass_csv(p):
@@ -43,7 +43,7 @@ def convert_quantclass_candle_csv(type_, time_interval):
         ]
         df = df[cols]
 
-        df.to_parquet(os.path.join(output_dir, f'{symbol}.pqt'), compression='zstd')
+        df.to_parquet(os.path.join(output_dir, f'{symbol}.pqt'), **PARQUET_WRITE_KWARGS)
 
     Parallel(
         n_jobs=Config.N_JOBS,
@@ -52,7 +52,19 @@ def convert_quantclass_candle_csv(type_, time_interval):
 
 
 def _group_csv_files(csv_dir) -> dict[str, list]:
-    csv_files = glob(os.path.join(csv_dir, f'*.csv')) + glob(os.path.join(csv_dir, '*', f'*.csv'))
+    # csv files sit directly under csv_dir or one level below it, walk both levels with scandir
+    # Same as glob: hidden entries (e.g. macOS ._XXX.csv) are skipped and symlinked subdirectories are followed
+    csv_files = []
+    with os.scandir(csv_dir) as it:
+        for entry in it:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                with os.scandir(entry.path) as sub_it:
+                    csv_files.extend(e.path for e in sub_it
+                                     if e.name.endswith('.csv') and not e.name.startswith('.') and e.is_file())
+            elif entry.name.endswith('.csv'):
+                csv_files.append(entry.path)
 
     sym_files = defaultdict(list)
     for p in csv_files:
@@ -66,10 +78,8 @@ def _create_output_dir(type_, time_interval):
 
     output_dir = os.path.join(Config.BINANCE_QUANTCLASS_DIR, dir_name, type_, time_interval)
 
-    if os.path.exists(output_dir):  # Remove dir if exists
-        logging.warn(f'Output dir {output_dir} exists, deleting')
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir, exist_ok=True)
+    if recreate_dir(output_dir):
+        logging.warning('Output dir %s existed, deleted and recreated', output_dir)
     return output_dir
 
 
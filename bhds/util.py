@@ -2,5 +2,9 @@ import json
 
 from config import Config
 
+# Parquet write options for candle data, consumers read these files far more often than they are written
+PARQUET_WRITE_KWARGS = {'compression': 'zstd', 'compression_level': 3, 'row_group_size': 131072}
+
+
 def read_candle_splits():
     return json.load(open(Config.BHDS_SPLIT_CONFIG_PATH))
\ No newline at end of file
@@ -7,8 +7,7 @@ import pandas as pd
 
 from fetcher import BinanceFetcher
 from msg_sender.dingding import DingDingSender
-from util import (DEFAULT_TZ, async_sleep_until_run_time, convert_interval_to_timedelta, create_aiohttp_session,
-                  next_run_time, now_time)
+from util import DEFAULT_TZ, async_sleep_until_run_time, create_aiohttp_session, next_run_time, now_time
 
 from .candle_listener import CandleListener
 from .candle_manager import CandleFileManager
@@ -44,14 +43,13 @@ async def fetch_and_save_history_candle(interval, candle_mgr: CandleFileManager,
     return not_enough, begin_time, num
 
 
-async def init_history(handler: BmacHandler, session: aiohttp.ClientSession):
+async def init_history(handler: BmacHandler, fetcher: BinanceFetcher):
     '''
     初始化历史阶段 init_history
     '''
-    fetcher, senders = init_conns(handler, session)
     candle_mgr = handler.candle_mgr
     exginfo_mgr = handler.exginfo_mgr
-    interval_delta = convert_interval_to_timedelta(handler.interval)
+    interval_delta = handler.interval_delta
     max_minute_weight, once_candles = fetcher.get_api_limits()
 
     run_time = next_run_time(handler.interval) - interval_delta
@@ -72,7 +70,8 @@ async def init_history(handler: BmacHandler, session: aiohttp.ClientSession):
     exginfo = await fetcher.get_exchange_info()
     symbols_trading: list = handler.symbol_filter(exginfo)
 
-    infos_trading = [info for sym, info in exginfo.items() if sym in symbols_trading]
+    trading_set = frozenset(symbols_trading)
+    infos_trading = [info for sym, info in exginfo.items() if sym in trading_set]
     df_exginfo = pd.DataFrame.from_records(infos_trading)
     exginfo_mgr.set_candle('exginfo', run_time, df_exginfo)
 
@@ -115,7 +114,6 @@ async def init_history(handler: BmacHandler, session: aiohttp.ClientSession):
 
             # 如果已经获取了足够的 K 线，或 K 线已不足（标的上市时间过短），则不需要继续获取
             if num >= handler.num_candles or not_enough:
-                df = candle_mgr.read_candle(symbol)
                 symbols_trading.remove(symbol)
                 if num < handler.num_candles:
                     logging.warn('%s finished not enough, candle num: %d', symbol, num)
@@ -135,7 +133,7 @@ async def period_alarm(handler: BmacHandler, main_que: asyncio.Queue):
     while True:
         # 计算出 self.interval 周期下次运行时间 run_time, 并 sleep 到 run_time
         run_time = next_run_time(handler.interval)
-        logging.info(f'Next candle update run at {run_time}')
+        logging.info('Next candle update run at %s', run_time)
         await async_sleep_until_run_time(run_time)
 
         req = {'type': 'update_exginfo', 'run_time': run_time}
@@ -188,13 +186,14 @@ def update_candle_data(handler: BmacHandler, df_new: pd.DataFrame, rest_que: asy
         candle_mgr.set_candle(symbol, run_time, df_new)
         return
 
-    df_old = candle_mgr.read_candle(symbol)
+    # 只需要旧数据的最大 candle_begin_time，不读取其它列
+    df_old = candle_mgr.read_candle(symbol, columns=['candle_begin_time'])
 
     max_old_begin_time = df_old['candle_begin_time'].max()
     min_new_begin_time = df_new['candle_begin_time'].min()
     max_new_begin_time = df_new['candle_begin_time'].max()
 
-    interval_delta = convert_interval_to_timedelta(handler.interval)
+    interval_delta = handler.interval_delta
     if max_old_begin_time >= max_new_begin_time:
         return
 
@@ -245,11 +244,15 @@ async def update_exginfo(handler: BmacHandler, fetcher: BinanceFetcher, senders:
     # 1. 根据 symbol_filter 过滤 symbol
     symbols_trading = symbol_filter(syminfo)
     symbols_last = candle_mgr.get_all_symbols()
-    notrading_symbols = set(symbols_last) - set(symbols_trading)
-    new_symbols = set(symbols_trading) - set(symbols_last)
+
+    # 只构建一次集合，后续成员判断均为 O(1)
+    trading_set = set(symbols_trading)
+    last_set = set(symbols_last)
+    notrading_symbols = last_set - trading_set
+    new_symbols = trading_set - last_set
 
     # 2. 保存过滤出的 exginfo
-    infos_trading = [info for sym, info in syminfo.items() if sym in symbols_trading]
+    infos_trading = [info for sym, info in syminfo.items() if sym in trading_set]
     df_syminfo = pd.DataFrame.from_records(infos_trading)
     exginfo_mgr.set_candle('exginfo', run_time, df_syminfo)
 
@@ -258,7 +261,7 @@ async def update_exginfo(handler: BmacHandler, fetcher: BinanceFetcher, senders:
 
     # 3. 删除之前有交易，但目前没有交易的 symbol
     if notrading_symbols:
-        logging.info(f'Remove not trading symbols {notrading_symbols}')
+        logging.info('Remove not trading symbols %s', notrading_symbols)
         msg['not_trading'] = list(notrading_symbols)
         for symbol in notrading_symbols:
             candle_mgr.remove_symbol(symbol)
@@ -296,7 +299,7 @@ async def update_funding_fee(handler: BmacHandler, fetcher: BinanceFetcher, run_
     df_funding = await fetcher.get_funding_rate()
     df_funding['time'] = run_time
     if exginfo_mgr.has_symbol('funding'):
-        interval_delta = convert_interval_to_timedelta(handler.interval)
+        interval_delta = handler.interval_delta
         df_funding_old = exginfo_mgr.read_candle('funding')
         df_funding = pd.concat([df_funding_old, df_funding])
         min_time = run_time - interval_delta * handler.num_candles
@@ -360,12 +363,11 @@ def create_listeners(trade_type, time_interval, symbols, n_groups, main_que) ->
     return listeners
 
 
-async def update_candle(handler: BmacHandler, session: aiohttp.ClientSession, last_complete_run_time):
+async def update_candle(handler: BmacHandler, fetcher: BinanceFetcher, senders: dict[str, DingDingSender],
+                        last_complete_run_time):
     '''
     定时获取 K线 update_candle_period
     '''
-    fetcher, senders = init_conns(handler, session)
-
     main_que = asyncio.Queue()
     rest_que = asyncio.Queue()
 
@@ -396,9 +398,10 @@ async def main(base_dir):
     while True:
         try:
             async with create_aiohttp_session(handler.http_timeout_sec) as session:
-
-                last_complete_run_time = await init_history(handler, session)
-                await update_candle(handler, session, last_complete_run_time)
+                # 初始化与定时更新共用同一个 fetcher，复用 session 中已建立的连接
+                fetcher, senders = init_conns(handler, session)
+                last_complete_run_time = await init_history(handler, fetcher)
+                await update_candle(handler, fetcher, senders, last_complete_run_time)
         except Exception as e:
             await report_error(handler, e)
             await asyncio.sleep(10)
@@ -406,7 +409,7 @@ async def main(base_dir):
 
 async def report_error(handler: BmacHandler, e: Exception):
     # 出错则通过钉钉报错
-    logging.error(f'An error occurred {str(e)}')
+    logging.error('An error occurred %s', e)
     import traceback
     traceback.print_exc()
     if handler.dingding is not None and 'error' in handler.dingding:
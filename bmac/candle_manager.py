@@ -1,34 +1,39 @@
 import os
-import shutil
 from glob import glob
 import time
 import pandas as pd
 
+from util import recreate_dir
 from util.time import now_time
 
 
 class CandleFileManager:
 
-    def __init__(self, base_dir, save_type):
+    # 存储格式到文件后缀映射
+    SAVE_TYPE_EXT = {'feather': 'fea', 'parquet': 'pqt'}
+
+    def __init__(self, base_dir, save_type, cache_reads=False):
         '''
         初始化，设定读写根目录
+        cache_reads 为 True 时缓存 read_candle 结果，文件 mtime 变化时失效
         '''
         self.base_dir = base_dir
         self.save_type = save_type
-        if save_type == 'feather':
-            self.ext = 'fea'
-        elif save_type == 'parquet':
-            self.ext = 'pqt'
-        else:
+        if save_type not in self.SAVE_TYPE_EXT:
             raise ValueError(f'Save type {save_type} not supported, can only accept feather and parquet')
+        self.ext = self.SAVE_TYPE_EXT[save_type]
+        self.cache_reads = cache_reads
+        self._read_cache = dict()
+        # 记录本进程写入的每个 symbol 当前 ready file 路径（无则为 None），避免每次 glob 扫描整个目录
+        self._ready_file_paths = dict()
 
     def clear_all(self):
         '''
         清空历史文件（如有），并创建根目录
         '''
-        if os.path.exists(self.base_dir):
-            shutil.rmtree(self.base_dir)
-        os.makedirs(self.base_dir)
+        recreate_dir(self.base_dir)
+        self._read_cache.clear()
+        self._ready_file_paths.clear()
 
     def format_ready_file_path(self, symbol, run_time):
         '''
@@ -46,6 +51,7 @@ class CandleFileManager:
         return file_path
 
     def save_data_file(self, symbol, df: pd.DataFrame):
+        self._read_cache.pop(symbol, None)
         df_path = self.format_data_file_path(symbol)
         if self.save_type == 'feather':
             df = df.reset_index(drop=True)
@@ -58,15 +64,30 @@ class CandleFileManager:
         设置K线，首先将新的K线 DataFrame 写入 Feather，然后删除旧 ready file，并生成新 ready file
         '''
         self.save_data_file(symbol, df)
+        self._remove_ready_files(symbol)
 
-        old_ready_file_paths = glob(os.path.join(self.base_dir, f'{symbol}_*.ready'))
-        for p in old_ready_file_paths:
-            os.remove(p)
-
+        ready_file_path = None
         if run_time is not None:
             ready_file_path = self.format_ready_file_path(symbol, run_time)
             with open(ready_file_path, 'w') as fout:
                 fout.write(str(now_time()))
+        self._ready_file_paths[symbol] = ready_file_path
+
+    def _remove_ready_files(self, symbol):
+        '''
+        删除 symbol 的旧 ready file，已记录则直接删除，否则（如进程重启后）才 glob 查找
+        '''
+        if symbol in self._ready_file_paths:
+            ready_file_path = self._ready_file_paths.pop(symbol)
+            paths = [] if ready_file_path is None else [ready_file_path]
+        else:
+            paths = glob(os.path.join(self.base_dir, f'{symbol}_*.ready'))
+
+        for p in paths:
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
 
     def update_candle(self, symbol, run_time, df_new: pd.DataFrame, num_candles):
         '''
@@ -92,16 +113,31 @@ class CandleFileManager:
         ready_file_path = self.format_ready_file_path(symbol, run_time)
         return os.path.exists(ready_file_path)
 
-    def read_candle(self, symbol) -> pd.DataFrame:
+    def read_candle(self, symbol, columns=None) -> pd.DataFrame:
         '''
-        读取 symbol 对应的 K线
+        读取 symbol 对应的 K线，columns 不为 None 时只读取指定列
+        cache_reads 为 True 时返回缓存的浅拷贝：可增删列、inplace 排序等，但不可原地修改单元格的值，否则会污染缓存
         '''
         df_path = self.format_data_file_path(symbol)
+        if not self.cache_reads or columns is not None:
+            return self._read_data_file(df_path, columns)
+
+        # 文件未被修改则直接返回缓存
+        mtime_ns = os.stat(df_path).st_mtime_ns
+        cached = self._read_cache.get(symbol)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1].copy(deep=False)
+
+        df = self._read_data_file(df_path)
+        self._read_cache[symbol] = (mtime_ns, df)
+        return df.copy(deep=False)
+
+    def _read_data_file(self, df_path, columns=None) -> pd.DataFrame:
         if self.save_type == 'feather':
-            df = pd.read_feather(df_path)
+            df = pd.read_feather(df_path, columns=columns)
             return df
         elif self.save_type == 'parquet':
-            return pd.read_parquet(df_path)
+            return pd.read_parquet(df_path, columns=columns)
 
     def has_symbol(self, symbol) -> bool:
         '''
@@ -114,16 +150,21 @@ class CandleFileManager:
         '''
         移除 symbol，包括删除对应的数据文件和 ready file
         '''
-        old_ready_file_paths = glob(os.path.join(self.base_dir, f'{symbol}_*.ready'))
-        for p in old_ready_file_paths:
-            os.remove(p)
-        df_path = self.format_data_file_path(symbol)
-        if os.path.exists(df_path):
-            os.remove(df_path)
+        self._read_cache.pop(symbol, None)
+        self._remove_ready_files(symbol)
+        try:
+            os.remove(self.format_data_file_path(symbol))
+        except FileNotFoundError:
+            pass
 
     def get_all_symbols(self):
         '''
         获取当前所有 symbol
         '''
-        paths = glob(os.path.join(self.base_dir, f'*.{self.ext}'))
-        return [os.path.splitext(os.path.basename(p))[0] for p in paths]
+        suffix = f'.{self.ext}'
+        # 与原 glob 行为一致：根目录不存在时返回空列表，并跳过隐藏文件
+        try:
+            with os.scandir(self.base_dir) as it:
+                return [e.name[:-len(suffix)] for e in it if e.name.endswith(suffix) and not e.name.startswith('.')]
+        except FileNotFoundError:
+            return []
@@ -2,6 +2,11 @@ import asyncio
 
 from . import bmac
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 
 class Bmac:
     """
@@ -9,4 +14,9 @@ class Bmac:
     """
 
     def start(self, base_dir):
-        asyncio.run(bmac.main(base_dir))
+        # Use uvloop for the long running service when it is installed, it is optional
+        # uvloop.run is only available from uvloop 0.18, older installs fall back to asyncio
+        if uvloop is not None and hasattr(uvloop, 'run'):
+            uvloop.run(bmac.main(base_dir))
+        else:
+            asyncio.run(bmac.main(base_dir))
@@ -1,5 +1,7 @@
 import os
 
+from util import convert_interval_to_timedelta
+
 from .candle_manager import CandleFileManager
 from .filter_symbol import create_symbol_filter
 
@@ -14,6 +16,8 @@ class BmacHandler:
 
         # K 线周期
         self.interval = cfg['interval']
+        # K 线周期对应的 timedelta，只计算一次
+        self.interval_delta = convert_interval_to_timedelta(self.interval)
         # 标的类型，可以是 'spot'/'usdt_spot', 'usdt_perp'/'usdt_swap', 'coin_perp'/'coin_swap'
         self.trade_type = cfg['trade_type']
 
@@ -46,8 +50,9 @@ class BmacHandler:
         self.candle_mgr = CandleFileManager(candle_dir, save_type)
 
         # exginfo_mgr: 用于管理 exchange info(合约交易规则)的 CandleFileManager
+        # exginfo 每周期只更新一次，但 K 线闭合检查期间每秒都会读取，因此缓存读取结果
         exginfo_dir = os.path.join(base_dir, f'exginfo_{self.interval}')
-        self.exginfo_mgr = CandleFileManager(exginfo_dir, save_type)
+        self.exginfo_mgr = CandleFileManager(exginfo_dir, save_type, cache_reads=True)
 
         self.trade_type = normalize_trade_type(self.trade_type)
 
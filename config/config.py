@@ -7,6 +7,7 @@ _CUR_DIR = os.path.dirname(os.path.realpath(__file__))
 
 class CFG:
     BINANCE_DATA_DIR = os.path.join(_BASE_DIR, 'binance_data')
+    BINANCE_AWS_DATA_DIR = os.path.join(BINANCE_DATA_DIR, 'aws_data')
     BINANCE_QUANTCLASS_DIR = os.path.join(_BASE_DIR, 'binance_quantclass')
     BHDS_EXTRA_EXGINFO_DIR = os.path.join(_CUR_DIR, 'bhds_extra_exginfo')
     BHDS_SPLIT_CONFIG_PATH = os.path.join(_CUR_DIR, 'binance_candle_split.json')
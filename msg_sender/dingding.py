@@ -16,7 +16,7 @@ def retry_getter(func, retry_times=5, sleep_seconds=1, default=None, raise_err=T
         try:
             return func()
         except Exception as e:
-            logging.warn(f'An error occurred {str(e)}')
+            logging.warning('An error occurred %s', e)
             if i == retry_times - 1 and raise_err:
                 raise e
             time.sleep(sleep_seconds)
@@ -1,59 +1,10 @@
 import asyncio
-import logging
 from datetime import datetime
 
-from api.binance.binance_market_ws import get_usdt_futures_kline_socket, get_coin_futures_kline_socket
+from bmac.candle_listener import CandleListener
+from bmac.filter_symbol import TradingUsdtPerpFilter
 from fetcher import BinanceFetcher
 from util import create_aiohttp_session
-from bmac.filter_symbol import TradingCoinPerpFilter, TradingUsdtPerpFilter
-
-TRADE_TYPE_MAP = {
-    'usdt_futures': get_usdt_futures_kline_socket,
-    'coin_futures': get_coin_futures_kline_socket,
-}
-
-
-class CandleListener:
-
-    def __init__(self, type_, symbols, time_interval, que):
-        self.trade_type = type_
-        self.symbols = set(symbols)
-        self.time_interval = time_interval
-        self.que: asyncio.Queue = que
-        self.req_reconnect = False
-
-    async def start_listen(self):
-        socket_func = TRADE_TYPE_MAP[self.trade_type]
-        while True:
-            socket = socket_func(self.symbols, self.time_interval)
-            async with socket as socket_conn:
-                while True:
-                    if self.req_reconnect:
-                        self.req_reconnect = False
-                        break
-                    try:
-                        res = await socket_conn.recv()
-                    except asyncio.TimeoutError:
-                        logging.debug('Recv candle ws timeout')
-                    if 'data' not in res:
-                        continue
-                    data = res['data']
-                    if data.get('e', None) == 'kline' and 'k' in data:
-                        candle = data['k']
-                        if candle.get('x', False):
-                            self.que.put_nowait(candle)
-
-    def add_symbols(self, *symbols):
-        for symbol in symbols:
-            self.symbols.add(symbol)
-
-    def remove_symbols(self, *symbols):
-        for symbol in symbols:
-            if symbol in self.symbols:
-                self.symbols.remove(symbol)
-
-    def req_reconnect(self):
-        self.req_reconnect = True
 
 
 async def print_candle(que):
@@ -1,5 +1,6 @@
 from .common import (STABLECOINS, async_retry_getter, batched,
-                     create_aiohttp_session, filter_symbols, get_loop,
-                     is_leverage_token)
+                     create_aiohttp_session, filter_symbols,
+                     gather_with_concurrency, get_loop, is_leverage_token)
 from .digit import remove_exponent
+from .fs import fast_rmtree_flat, recreate_dir
 from .time import DEFAULT_TZ, convert_interval_to_timedelta, now_time, async_sleep_until_run_time, next_run_time
@@ -5,9 +5,16 @@ from itertools import islice
 import aiohttp
 
 
-def create_aiohttp_session(timeout_sec):
+def create_aiohttp_session(timeout_sec, limit=100, limit_per_host=0):
     timeout = aiohttp.ClientTimeout(total=timeout_sec)
-    session = aiohttp.ClientSession(timeout=timeout)
+    # Connection limits default to aiohttp's, callers with many concurrent requests to one host pass their own
+    # DNS is cached for the session lifetime and idle connections are kept alive longer
+    connector = aiohttp.TCPConnector(limit=limit,
+                                     limit_per_host=limit_per_host,
+                                     ttl_dns_cache=300,
+                                     keepalive_timeout=60)
+    # trust_env picks up HTTP(S)_PROXY from the environment once per session, no per-request proxy plumbing
+    session = aiohttp.ClientSession(timeout=timeout, connector=connector, trust_env=True)
     return session
 
 
@@ -27,6 +34,19 @@ async def async_retry_getter(func, max_times=5, **kwargs):
             sleep_seconds *= 2
 
 
+async def gather_with_concurrency(n, *coros, return_exceptions=False):
+    """
+    Same as asyncio.gather, but at most n coroutines are awaited at the same time
+    """
+    sem = asyncio.Semaphore(n)
+
+    async def _run(coro):
+        async with sem:
+            return await coro
+
+    return await asyncio.gather(*(_run(c) for c in coros), return_exceptions=return_exceptions)
+
+
 def batched(iterable, n):
     """
     batched('ABCDEFG', 3) --> ABC DEF G 
@@ -54,10 +74,10 @@ def get_loop():
             raise
 
 
-STABLECOINS = {
+STABLECOINS = frozenset({
     'BKRWUSDT', 'USDCUSDT', 'USDPUSDT', 'TUSDUSDT', 'BUSDUSDT', 'FDUSDUSDT', 'DAIUSDT', 'EURUSDT', 'GBPUSDT',
     'USBPUSDT', 'SUSDUSDT', 'PAXGUSDT', 'AEURUSDT', 'USDSUSDT', 'USDSBUSDT'
-}
+})
 
 
 def is_leverage_token(x: str):
@@ -67,10 +87,7 @@ def is_leverage_token(x: str):
 
 
 def filter_symbols(symbols):
-    lev_symbols = {x for x in symbols if is_leverage_token(x)}
-    not_usdt_symbols = {x for x in symbols if not x.endswith('USDT')}
-
-    excludes = set.union(not_usdt_symbols, lev_symbols, STABLECOINS).intersection(symbols)
-
-    symbols_filtered = sorted(set(symbols) - excludes)
+    # Single pass over symbols, only the kept ones are hashed
+    symbols_filtered = sorted(
+        {x for x in symbols if x.endswith('USDT') and x not in STABLECOINS and not is_leverage_token(x)})
     return symbols_filtered
@@ -0,0 +1,41 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _remove_entry(entry: os.DirEntry):
+    # DirEntry caches d_type from readdir, no extra lstat is needed here
+    try:
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.unlink(entry.path)
+    except FileNotFoundError:
+        # Removed concurrently by someone else, which is what we want anyway
+        pass
+
+
+def fast_rmtree_flat(dir_path, workers=8):
+    """
+    Remove a directory whose content is mostly a flat list of files, e.g. {symbol}.pqt
+    Entries are listed with a single os.scandir and unlinked by a thread pool
+    """
+    with os.scandir(dir_path) as it:
+        entries = list(it)
+
+    with ThreadPoolExecutor(max_workers=workers) as exe:
+        list(exe.map(_remove_entry, entries))
+
+    os.rmdir(dir_path)
+
+
+def recreate_dir(dir_path):
+    """
+    Remove dir_path with fast_rmtree_flat if it exists, then create it empty
+    Returns True if an existing directory was removed
+    """
+    existed = os.path.isdir(dir_path)
+    if existed:
+        fast_rmtree_flat(dir_path)
+    os.makedirs(dir_path)
+    return existed
@@ -1,5 +1,6 @@
 import asyncio
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 import pytz
 
@@ -10,6 +11,7 @@ def now_time() -> datetime:
     return datetime.now(DEFAULT_TZ)
 
 
+@lru_cache(maxsize=None)
 def convert_interval_to_timedelta(time_interval: str) -> timedelta:
     if time_interval.endswith('m') or time_interval.endswith('T'):
         return timedelta(minutes=int(time_interval[:-1]))